@@ -17,14 +17,19 @@
 ControlNet Encoder based on GeneralDIT
 """
 
+from contextlib import nullcontext
 from typing import List, Optional, Tuple
 
-import numpy as np
 import torch
-from einops import rearrange
 from megatron.core import parallel_state
 from torch import nn
-from torchvision import transforms
+
+try:
+    from torchao.quantization import int8_weight_only, quantize_
+
+    USE_TORCHAO = True
+except ImportError:
+    USE_TORCHAO = False
 
 from cosmos_transfer1.diffusion.conditioner import DataType
 from cosmos_transfer1.diffusion.module.blocks import zero_module
@@ -59,12 +64,26 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
             assert num_control_blocks > 0 and num_control_blocks <= kwargs["num_blocks"]
             kwargs["layer_mask"] = [False] * num_control_blocks + [True] * (kwargs["num_blocks"] - num_control_blocks)
         self.random_drop_control_blocks = kwargs.pop("random_drop_control_blocks", False)
+        compile_model = kwargs.pop("compile_model", False)
+        self.use_inference_mode = kwargs.pop("use_inference_mode", False)
+        # Also skip dead control-branch compute during training; leaves parameters unused, so DDP needs
+        # find_unused_parameters=True. At inference the dead compute is always skipped.
+        self.skip_inactive_ctrl_branch = kwargs.pop("skip_inactive_ctrl_branch", False)
         super().__init__(*args, in_channels=new_input_channels, **kwargs)
+        self._tp_group = parallel_state.get_tensor_model_parallel_group() if self.sequence_parallel else None
         num_blocks = self.num_blocks
         model_channels = self.model_channels
         layer_mask = kwargs.get("layer_mask", None)
         layer_mask = [False] * num_blocks if layer_mask is None else layer_mask
         self.layer_mask = layer_mask
+        self._num_control_blocks = layer_mask.index(True) if True in layer_mask else len(layer_mask)
+        # Whether the base model passed to forward has trainable parameters; scanned lazily on the first forward.
+        self._base_model_trainable_cached = None
+        self._control_linears_quantized = False
+        # Whether the attached hint_encoders can be batched, checked once per list; see can_batch_hint_encoders.
+        # The tuple keeps the list referenced without registering it as a submodule.
+        self._hint_encoders_cache_src = None
+        self._hint_encoders_batchable = False
         self.hint_channels = hint_channels
         self.build_hint_patch_embed()
         hint_nf = [16, 16, 32, 32, 96, 96, 256]
@@ -82,7 +101,46 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
             self.zero_blocks[f"block{idx}"] = zero_module(nn.Linear(model_channels, model_channels))
         self.input_hint_block.append(zero_module(nn.Linear(hint_nf[-1], model_channels)))
 
+        # Only the hint encoder is compiled; the DiT blocks go through TransformerEngine attention, which does not
+        # capture well into CUDA graphs. The zero_blocks stay eager: each is a single GEMM with nothing to fuse, and
+        # a CUDA graph would have to copy its THWBD input into a static buffer on every call.
+        # input_hint_block is compiled in place with Module.compile, which keeps its state_dict keys, so Inductor
+        # fuses each Linear + SiLU pair wherever the module is called.
+        self.compile_model = compile_model and torch.cuda.is_available()
+        if self.compile_model:
+            self._compiled_encode_hint = torch.compile(self.encode_hint, mode="reduce-overhead", dynamic=False)
+            self.input_hint_block.compile(mode="reduce-overhead", dynamic=False)
+        else:
+            self._compiled_encode_hint = self.encode_hint
+
+    def set_base_model_trainable(self, trainable: Optional[bool] = None) -> None:
+        """
+        Updates the cached trainability of the base model used for control branch dropout.
+        Call this after toggling requires_grad on the base model; None makes the next forward rescan its parameters.
+        """
+        self._base_model_trainable_cached = trainable
+
+    def quantize_control_linears(self) -> None:
+        """
+        Applies torchao int8 weight-only quantization to the input_hint_block and zero_blocks linears.
+        These small GEMMs are weight-bandwidth bound, so halving the bytes read from bf16 speeds them up.
+        Inference only: call after the checkpoint is loaded and the model is cast to its working precision.
+        Activations and outputs keep the model dtype. For multicontrol, every attached hint encoder is quantized.
+        """
+        if not USE_TORCHAO:
+            raise ImportError("torchao is required for quantize_control_linears; install it with `pip install torchao`")
+        encoders = [self] + (list(self.hint_encoders) if hasattr(self, "hint_encoders") else [])
+        for encoder in encoders:
+            if getattr(encoder, "_control_linears_quantized", False):
+                continue
+            quantize_(encoder.input_hint_block, int8_weight_only())
+            quantize_(encoder.zero_blocks, int8_weight_only())
+            encoder._control_linears_quantized = True
+        # Quantized encoders can no longer be batched; make the next forward re-check.
+        self._hint_encoders_cache_src = None
+
     def _set_sequence_parallel(self, status: bool):
+        self._tp_group = parallel_state.get_tensor_model_parallel_group() if status else None
         self.zero_blocks.sequence_parallel = status
         self.input_hint_block.sequence_parallel = status
         super()._set_sequence_parallel(status)
@@ -110,19 +168,35 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
             # Initialize patch_embed like nn.Linear (instead of nn.Conv2d)
             w = self.x_embedder2.proj.weight.data
             nn.init.xavier_uniform_(w.view([w.shape[0], -1]))
+            # cuDNN picks faster NDHWC kernels for the Conv3d patch embedding on Volta and newer.
+            self.x_embedder2 = self.x_embedder2.to(memory_format=torch.channels_last_3d)
+
+    def pad_hint_channels(self, hint: torch.Tensor) -> torch.Tensor:
+        assert hint.size(1) <= self.hint_channels, f"Expected hint channels <= {self.hint_channels}, got {hint.size(1)}"
+        if hint.size(1) < self.hint_channels:
+            # Zero-pad the channel dim in place of allocating a zeros tensor and concatenating it.
+            padding = [0, 0] * (hint.ndim - 2) + [0, self.hint_channels - hint.size(1)]
+            hint = torch.nn.functional.pad(hint, padding)
+        return hint
+
+    def concat_hint_padding_mask(self, x_B_C_T_H_W: torch.Tensor, padding_mask: torch.Tensor) -> torch.Tensor:
+        if padding_mask.shape[-2:] != x_B_C_T_H_W.shape[-2:]:
+            # Same nearest resize as torchvision's, without its dispatch; skipped at matching resolution.
+            padding_mask = torch.nn.functional.interpolate(
+                padding_mask.reshape(-1, 1, *padding_mask.shape[-2:]), size=x_B_C_T_H_W.shape[-2:], mode="nearest"
+            ).view(*padding_mask.shape[:-2], *x_B_C_T_H_W.shape[-2:])
+        # expand is a stride-0 view; torch.cat reads it directly, so the B x 1 x T x H x W mask is never materialized.
+        padding_mask_B_1_T_H_W = padding_mask.unsqueeze(1).expand(x_B_C_T_H_W.shape[0], 1, x_B_C_T_H_W.shape[2], -1, -1)
+        return torch.cat([x_B_C_T_H_W, padding_mask_B_1_T_H_W], dim=1)
 
     def prepare_hint_embedded_sequence(
         self, x_B_C_T_H_W: torch.Tensor, fps: Optional[torch.Tensor] = None, padding_mask: Optional[torch.Tensor] = None
     ) -> Tuple[torch.Tensor, Optional[torch.Tensor]]:
         if self.concat_padding_mask:
-            padding_mask = transforms.functional.resize(
-                padding_mask, list(x_B_C_T_H_W.shape[-2:]), interpolation=transforms.InterpolationMode.NEAREST
-            )
-            x_B_C_T_H_W = torch.cat(
-                [x_B_C_T_H_W, padding_mask.unsqueeze(1).repeat(x_B_C_T_H_W.shape[0], 1, x_B_C_T_H_W.shape[2], 1, 1)],
-                dim=1,
-            )
+            x_B_C_T_H_W = self.concat_hint_padding_mask(x_B_C_T_H_W, padding_mask)
 
+        if self.legacy_patch_emb:
+            x_B_C_T_H_W = x_B_C_T_H_W.contiguous(memory_format=torch.channels_last_3d)
         x_B_T_H_W_D = self.x_embedder2(x_B_C_T_H_W)
 
         if "rope" in self.pos_emb_cls.lower():
@@ -141,11 +215,7 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
         padding_mask: Optional[torch.Tensor] = None,
         data_type: Optional[DataType] = DataType.VIDEO,
     ) -> torch.Tensor:
-        assert hint.size(1) <= self.hint_channels, f"Expected hint channels <= {self.hint_channels}, got {hint.size(1)}"
-        if hint.size(1) < self.hint_channels:
-            padding_shape = list(hint.shape)
-            padding_shape[1] = self.hint_channels - hint.size(1)
-            hint = torch.cat([hint, torch.zeros(*padding_shape, dtype=hint.dtype, device=hint.device)], dim=1)
+        hint = self.pad_hint_channels(hint)
         assert isinstance(
             data_type, DataType
         ), f"Expected DataType, got {type(data_type)}. We need discuss this flag later."
@@ -153,12 +223,11 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
         hint_B_T_H_W_D, _ = self.prepare_hint_embedded_sequence(hint, fps=fps, padding_mask=padding_mask)
 
         if self.blocks["block0"].x_format == "THWBD":
-            hint = rearrange(hint_B_T_H_W_D, "B T H W D -> T H W B D")
+            hint = hint_B_T_H_W_D.permute(1, 2, 3, 0, 4)  # [T, H, W, B, D]
             if self.sequence_parallel:
-                tp_group = parallel_state.get_tensor_model_parallel_group()
                 T, H, W, B, D = hint.shape
                 hint = hint.view(T * H * W, 1, 1, B, -1)
-                hint = scatter_along_first_dim(hint, tp_group)
+                hint = scatter_along_first_dim(hint, self._tp_group)
         elif self.blocks["block0"].x_format == "BTHWD":
             hint = hint_B_T_H_W_D
         else:
@@ -167,7 +236,140 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
         guided_hint = self.input_hint_block(hint)
         return guided_hint
 
-    def forward(
+    def can_batch_hint_encoders(self, num_hints: int) -> bool:
+        """Whether all multicontrol hint encoders can be evaluated in one vectorized pass."""
+        if self._hint_encoders_cache_src is None or self._hint_encoders_cache_src[0] is not self.hint_encoders:
+            self._hint_encoders_cache_src = (self.hint_encoders,)
+            encoders = list(self.hint_encoders)
+            # Non-rope position embeddings are added per control inside prepare_hint_embedded_sequence,
+            # and packed int8 weights cannot be stacked for vmap.
+            batchable = (
+                len(encoders) >= 2
+                and "rope" in self.pos_emb_cls.lower()
+                and not any(getattr(encoder, "_control_linears_quantized", False) for encoder in encoders)
+            )
+            for module_name in ("x_embedder2", "input_hint_block"):
+                ref_shapes = [(n, p.shape) for n, p in getattr(encoders[0], module_name).named_parameters()]
+                batchable = batchable and all(
+                    [(n, p.shape) for n, p in getattr(encoder, module_name).named_parameters()] == ref_shapes
+                    for encoder in encoders[1:]
+                )
+            self._hint_encoders_batchable = batchable
+        return self._hint_encoders_batchable and num_hints == len(self.hint_encoders)
+
+    def encode_hints_batched(
+        self,
+        hint: torch.Tensor,
+        fps: Optional[torch.Tensor] = None,
+        padding_mask: Optional[torch.Tensor] = None,
+        data_type: Optional[DataType] = DataType.VIDEO,
+    ) -> List[torch.Tensor]:
+        """
+        Multicontrol counterpart of encode_hint that runs every control's x_embedder2 and input_hint_block
+        in a single vmap over their stacked weights, instead of one forward per control.
+
+        Args:
+            hint: (B, N, C, T, H, W) tensor of N control inputs, one per entry of self.hint_encoders
+        Returns:
+            List of N guided hints, matching what encode_hint returns for each control
+        """
+        assert isinstance(
+            data_type, DataType
+        ), f"Expected DataType, got {type(data_type)}. We need discuss this flag later."
+        B, N = hint.shape[:2]
+        hint_NB_C_T_H_W = self.pad_hint_channels(hint.transpose(0, 1).flatten(0, 1))
+        if self.concat_padding_mask:
+            if padding_mask.shape[0] > 1:
+                # The hints are flattened control-major, so each control needs its own copy of the per-sample masks.
+                padding_mask = padding_mask.repeat(N, *([1] * (padding_mask.ndim - 1)))
+            hint_NB_C_T_H_W = self.concat_hint_padding_mask(hint_NB_C_T_H_W, padding_mask)
+        hint_N_B_C_T_H_W = hint_NB_C_T_H_W.unflatten(0, (N, B))
+
+        # Rope position embeddings are applied inside the blocks, so the hint only goes through x_embedder2 here.
+        hint_N_B_T_H_W_D = self._vmap_hint_encoders("x_embedder2", hint_N_B_C_T_H_W)
+
+        if self.blocks["block0"].x_format == "THWBD":
+            hints = hint_N_B_T_H_W_D.permute(0, 2, 3, 4, 1, 5)  # [N, T, H, W, B, D]
+            if self.sequence_parallel:
+                _, T, H, W, B, D = hints.shape
+                hints = torch.stack(
+                    [scatter_along_first_dim(h.reshape(T * H * W, 1, 1, B, D), self._tp_group) for h in hints]
+                )
+        elif self.blocks["block0"].x_format == "BTHWD":
+            hints = hint_N_B_T_H_W_D
+        else:
+            raise ValueError(f"Unknown x_format {self.blocks['block0'].x_format}")
+
+        guided_hints = self._vmap_hint_encoders("input_hint_block", hints)
+        return list(guided_hints.unbind(0))
+
+    def _vmap_hint_encoders(self, module_name: str, x_N: torch.Tensor) -> torch.Tensor:
+        """Applies hint_encoders[i].<module_name> to x_N[i] for every control i in one vmapped call."""
+        modules = [getattr(encoder, module_name) for encoder in self.hint_encoders]
+        # Stacked fresh on every call, so EMA swaps and checkpoint loads are always picked up; torch.stack also
+        # keeps the stacked weights connected to the per-control parameters in the autograd graph.
+        params = [dict(m.named_parameters()) for m in modules]
+        buffers = [dict(m.named_buffers()) for m in modules]
+        stacked_params = {name: torch.stack([d[name] for d in params]) for name in params[0]}
+        stacked_buffers = {name: torch.stack([d[name] for d in buffers]) for name in buffers[0]}
+
+        def call_module(params, buffers, x):
+            return torch.func.functional_call(modules[0], (params, buffers), (x,))
+
+        return torch.vmap(call_module)(stacked_params, stacked_buffers, x_N)
+
+    def _block_step(
+        self,
+        zero_block: nn.Module,
+        x: torch.Tensor,
+        scale: float | torch.Tensor,
+        out: Optional[torch.Tensor] = None,
+    ) -> torch.Tensor:
+        """
+        Projects a block output through its zero_block and applies the per-hint control scale, already gated.
+        If out is given, the result is accumulated into it in place and out is returned.
+        """
+        # Folding reads zero_block.weight directly and bypasses the module call, and with it forward hooks and FSDP's
+        # pre-forward unshard, so it is only done without grad. Quantized weights are packed tensor subclasses, so the
+        # scale cannot be folded into them. Check the module itself: in multicontrol it belongs to one of the
+        # hint_encoders, whose quantization state may differ from ours.
+        is_scalar = isinstance(scale, (float, int))
+        if (
+            is_scalar
+            and not torch.is_grad_enabled()
+            and type(zero_block.weight) in (torch.Tensor, nn.Parameter)
+            and (scale != 1 or out is not None)
+        ):
+            # (Wx + b) * s == (sW)x + sb: scaling the D x D weights is far cheaper than scaling the THWBD activation.
+            if out is not None:
+                # Let the GEMM scale and accumulate into out directly, so no temporary hint_val is allocated.
+                out_2d = out.view(-1, out.shape[-1])
+                out_2d.addmm_(x.reshape(-1, x.shape[-1]), zero_block.weight.t(), alpha=scale)
+                if zero_block.bias is not None:
+                    out_2d.add_(zero_block.bias, alpha=scale)
+                return out
+            bias = zero_block.bias * scale if zero_block.bias is not None else None
+            return torch.nn.functional.linear(x, zero_block.weight * scale, bias)
+        hint_val = zero_block(x)
+        if out is not None:
+            if is_scalar:
+                return out.add_(hint_val, alpha=scale)
+            return out.addcmul_(hint_val, scale)
+        if is_scalar and scale == 1:
+            return hint_val
+        return hint_val * scale
+
+    def forward(self, *args, **kwargs) -> torch.Tensor | List[torch.Tensor] | Tuple[torch.Tensor, List[torch.Tensor]]:
+        """
+        See _forward_impl. With use_inference_mode set and grad disabled by the caller, the whole control
+        and base model pass runs under torch.inference_mode, which also skips version counter and view tracking.
+        """
+        # inference_mode(False) would re-enable grad inside a caller's no_grad, so only enter it when it applies.
+        use_inference_mode = self.use_inference_mode and not torch.is_grad_enabled()
+        with torch.inference_mode() if use_inference_mode else nullcontext():
+            return self._forward_impl(*args, **kwargs)
+
+    def _forward_impl(
         self,
         x: torch.Tensor,
         timesteps: torch.Tensor,
@@ -223,14 +425,23 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
             )
 
         if hasattr(self, "hint_encoders"):  # for multicontrol
-            guided_hints = []
-            for i in range(hint.shape[1]):
-                self.input_hint_block = self.hint_encoders[i].input_hint_block
-                self.pos_embedder = self.hint_encoders[i].pos_embedder
-                self.x_embedder2 = self.hint_encoders[i].x_embedder2
-                guided_hints += [self.encode_hint(hint[:, i], fps=fps, padding_mask=padding_mask, data_type=data_type)]
+            if self.can_batch_hint_encoders(hint.shape[1]):
+                guided_hints = self.encode_hints_batched(hint, fps=fps, padding_mask=padding_mask, data_type=data_type)
+                # Leave the same per-control modules in place as the sequential path below would.
+                self.input_hint_block = self.hint_encoders[-1].input_hint_block
+                self.pos_embedder = self.hint_encoders[-1].pos_embedder
+                self.x_embedder2 = self.hint_encoders[-1].x_embedder2
+            else:
+                guided_hints = []
+                for i in range(hint.shape[1]):
+                    self.input_hint_block = self.hint_encoders[i].input_hint_block
+                    self.pos_embedder = self.hint_encoders[i].pos_embedder
+                    self.x_embedder2 = self.hint_encoders[i].x_embedder2
+                    guided_hints += [
+                        self._compiled_encode_hint(hint[:, i], fps=fps, padding_mask=padding_mask, data_type=data_type)
+                    ]
         else:
-            guided_hints = self.encode_hint(hint, fps=fps, padding_mask=padding_mask, data_type=data_type)
+            guided_hints = self._compiled_encode_hint(hint, fps=fps, padding_mask=padding_mask, data_type=data_type)
             guided_hints = torch.chunk(guided_hints, hint.shape[0] // x.shape[0], dim=3)
             # Only support multi-control at inference time
             assert len(guided_hints) == 1 or not torch.is_grad_enabled()
@@ -243,15 +454,16 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
         if data_type == DataType.VIDEO:
             if condition_video_input_mask is not None:
                 if self.cp_group is not None:
-                    condition_video_input_mask = rearrange(
-                        condition_video_input_mask, "B C (V T) H W -> B C V T H W", V=self.n_views
-                    )
+                    B_m, C_m, VT_m, H_m, W_m = condition_video_input_mask.shape
+                    condition_video_input_mask = condition_video_input_mask.reshape(
+                        B_m, C_m, self.n_views, VT_m // self.n_views, H_m, W_m
+                    )  # [B, C, V, T, H, W]
                     condition_video_input_mask = split_inputs_cp(
                         condition_video_input_mask, seq_dim=3, cp_group=self.cp_group
                     )
-                    condition_video_input_mask = rearrange(
-                        condition_video_input_mask, "B C V T H W -> B C (V T) H W", V=self.n_views
-                    )
+                    condition_video_input_mask = condition_video_input_mask.view(
+                        B_m, C_m, -1, H_m, W_m
+                    )  # [B, C, V * T, H, W]
                 input_list = [x, condition_video_input_mask]
                 x = torch.cat(
                     input_list,
@@ -274,37 +486,46 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
         else:
             crossattn_mask = None
 
-        if self.blocks["block0"].x_format == "THWBD":
-            crossattn_emb = rearrange(crossattn_emb, "B M D -> M B D")
+        x_format = self.blocks["block0"].x_format
+        is_thwbd = x_format == "THWBD"
+        if is_thwbd:
+            crossattn_emb = crossattn_emb.permute(1, 0, 2)  # [M, B, D]
             if crossattn_mask:
-                crossattn_mask = rearrange(crossattn_mask, "B M -> M B")
+                crossattn_mask = crossattn_mask.permute(1, 0)  # [M, B]
 
         outs = {}
 
         # If also training base model, sometimes drop the controlnet branch to only train base branch.
         # This is to prevent the network become dependent on controlnet branch and make control weight useless.
         is_training = torch.is_grad_enabled()
-        is_training_base_model = any(p.requires_grad for p in base_model.parameters())
+        if self._base_model_trainable_cached is None:
+            self._base_model_trainable_cached = any(p.requires_grad for p in base_model.parameters())
+        is_training_base_model = self._base_model_trainable_cached
         if is_training and is_training_base_model:
-            coin_flip = torch.rand(B).to(x.device) > self.dropout_ctrl_branch  # prob for only training base model
-            if self.blocks["block0"].x_format == "THWBD":
+            # prob for only training base model
+            coin_flip = (torch.rand(B, device=x.device) > self.dropout_ctrl_branch).to(x.dtype)
+            if is_thwbd:
                 coin_flip = coin_flip[None, None, None, :, None]
-            elif self.blocks["block0"].x_format == "BTHWD":
+            elif x_format == "BTHWD":
                 coin_flip = coin_flip[:, None, None, None, None]
         else:
             coin_flip = 1
+        skip_inactive = not is_training or self.skip_inactive_ctrl_branch
+        if skip_inactive and isinstance(coin_flip, torch.Tensor) and not coin_flip.any():
+            # Every sample dropped the control branch, so none of its outputs would reach the base model.
+            guided_hints = []
 
-        num_control_blocks = self.layer_mask.index(True)
+        num_control_blocks = self._num_control_blocks
         if self.random_drop_control_blocks:
             if is_training:  # Use a random number of layers during training.
-                num_layers_to_use = np.random.randint(num_control_blocks) + 1
+                # Draw from torch's (CPU) generator so the layer count follows torch seeding, not numpy's.
+                num_layers_to_use = int(torch.randint(1, num_control_blocks + 1, (1,)).item())
             elif num_layers_to_use == -1:  # Evaluate using all the layers.
                 num_layers_to_use = num_control_blocks
             else:  # Use the specified number of layers during inference.
                 pass
         else:  # Use all of the layers.
             num_layers_to_use = num_control_blocks
-        control_gate_per_layer = [i < num_layers_to_use for i in range(num_control_blocks)]
 
         if isinstance(control_weight, torch.Tensor):
             if control_weight.ndim == 0:  # Single scalar tensor
@@ -317,7 +538,8 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
             control_weight = [control_weight] * len(guided_hints)
 
         # max_norm = {}
-        x_before_blocks = x.clone()
+        # Every hint restarts from the same input; with a single hint there is nothing to restart, so skip the copy.
+        x_before_blocks = x if len(guided_hints) <= 1 else x.clone()
         for i, guided_hint in enumerate(guided_hints):
             x = x_before_blocks
             if hasattr(self, "hint_encoders"):  # for multicontrol
@@ -372,14 +594,12 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
             self.affline_scale_log_info = affline_scale_log_info
             self.affline_emb = affline_emb_B_D
 
-            x = rearrange(x_B_T_H_W_D, "B T H W D -> T H W B D")
+            x = x_B_T_H_W_D.permute(1, 2, 3, 0, 4)  # [T, H, W, B, D]
             if extra_pos_emb_B_T_H_W_D_or_T_H_W_B_D is not None:
-                extra_pos_emb_B_T_H_W_D_or_T_H_W_B_D = rearrange(
-                    extra_pos_emb_B_T_H_W_D_or_T_H_W_B_D, "B T H W D -> T H W B D"
-                )
+                extra_pos_emb_B_T_H_W_D_or_T_H_W_B_D = extra_pos_emb_B_T_H_W_D_or_T_H_W_B_D.permute(1, 2, 3, 0, 4)
 
             if self.sequence_parallel:
-                tp_group = parallel_state.get_tensor_model_parallel_group()
+                tp_group = self._tp_group
                 # Sequence parallel requires the input tensor to be scattered along the first dimension.
                 assert self.block_config == "FA-CA-MLP"  # Only support this block config for now
                 T, H, W, B, D = x.shape
@@ -395,10 +615,58 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
                         extra_pos_emb_B_T_H_W_D_or_T_H_W_B_D, tp_group
                     )
 
+            # The control weight only depends on the hint, so it is prepared once for all blocks.
+            if isinstance(control_weight[i], (float, int)) or control_weight[i].ndim < 2:
+                weight = control_weight[i]
+            else:  # Spatial-temporal weights [num_controls, B, 1, T, H, W]
+                # Get current feature dimensions
+                if is_thwbd:
+                    weight_map = control_weight[i]  # [B, 1, T, H, W]
+
+                    if weight_map.shape[2:5] != (T, H, W):
+                        assert weight_map.shape[2] == 8 * (T - 1) + 1
+                        # The first frame maps to one latent frame and each following chunk of 8 frames to one
+                        # latent frame. Fold the chunks into the batch dim so a single interpolate covers them all.
+                        B_w, C_w, _, H_w, W_w = weight_map.shape
+                        weight_map_head = torch.nn.functional.interpolate(
+                            weight_map[:, :, :1], size=(1, H, W), mode="trilinear", align_corners=False
+                        )
+                        weight_map_tail = (
+                            weight_map[:, :, 1:]
+                            .reshape(B_w, C_w, T - 1, 8, H_w, W_w)
+                            .transpose(1, 2)
+                            .reshape(B_w * (T - 1), C_w, 8, H_w, W_w)
+                        )
+                        weight_map_tail = torch.nn.functional.interpolate(
+                            weight_map_tail, size=(1, H, W), mode="trilinear", align_corners=False
+                        )
+                        weight_map_tail = weight_map_tail.view(B_w, T - 1, C_w, H, W).transpose(1, 2)
+                        weight_map = torch.cat([weight_map_head, weight_map_tail], dim=2)
+
+                    # Reshape to match THWBD format
+                    weight_map = weight_map.permute(2, 3, 4, 0, 1)  # [T, H, W, B, 1]
+                    weight_map = weight_map.reshape(T * H * W, 1, 1, B, 1)
+                    if self.sequence_parallel:
+                        weight_map = scatter_along_first_dim(weight_map, tp_group)
+
+                else:  # BTHWD format
+                    raise NotImplementedError("BTHWD format for weight map is not implemented yet.")
+                weight = weight_map
+            # Apply the branch dropout once per hint instead of once per block.
+            scaled_gate = weight * coin_flip
+
+            # All blocks of an encoder are built with the same block_x_format, so checking the first one suffices.
+            assert (
+                blocks["block0"].x_format == x_format
+            ), f"Expected x_format {x_format}, got {blocks['block0'].x_format}"
+
             for idx, (name, block) in enumerate(blocks.items()):
-                assert (
-                    blocks["block0"].x_format == block.x_format
-                ), f"First block has x_format {blocks[0].x_format}, got {block.x_format}"
+                gate = idx < num_layers_to_use
+                if not gate and skip_inactive:
+                    # Gates are on for a prefix of the blocks only, so every remaining hint_val would be zero.
+                    # Unless skip_inactive_ctrl_branch is set, training still runs them so all parameters
+                    # stay in the DDP graph.
+                    break
                 x = block(
                     x,
                     affline_emb_B_D,
@@ -412,51 +680,11 @@ class GeneralDITMulticamEncoder(MultiCameraGeneralDIT):
                     x = x + guided_hint
                     guided_hint = None
 
-                gate = control_gate_per_layer[idx]
-                if isinstance(control_weight[i], (float, int)) or control_weight[i].ndim < 2:
-                    hint_val = zero_blocks[name](x) * control_weight[i] * coin_flip * gate
-                else:  # Spatial-temporal weights [num_controls, B, 1, T, H, W]
-                    control_feat = zero_blocks[name](x)
-
-                    # Get current feature dimensions
-                    if self.blocks["block0"].x_format == "THWBD":
-                        weight_map = control_weight[i]  # [B, 1, T, H, W]
-
-                        if weight_map.shape[2:5] != (T, H, W):
-                            assert weight_map.shape[2] == 8 * (T - 1) + 1
-                            weight_map_i = [
-                                torch.nn.functional.interpolate(
-                                    weight_map[:, :, :1, :, :],
-                                    size=(1, H, W),
-                                    mode="trilinear",
-                                    align_corners=False,
-                                )
-                            ]
-                            for wi in range(1, weight_map.shape[2], 8):
-                                weight_map_i += [
-                                    torch.nn.functional.interpolate(
-                                        weight_map[:, :, wi : wi + 8],
-                                        size=(1, H, W),
-                                        mode="trilinear",
-                                        align_corners=False,
-                                    )
-                                ]
-                            weight_map = torch.cat(weight_map_i, dim=2)
-
-                        # Reshape to match THWBD format
-                        weight_map = weight_map.permute(2, 3, 4, 0, 1)  # [T, H, W, B, 1]
-                        weight_map = weight_map.view(T * H * W, 1, 1, B, 1)
-                        if self.sequence_parallel:
-                            weight_map = scatter_along_first_dim(weight_map, tp_group)
-
-                    else:  # BTHWD format
-                        raise NotImplementedError("BTHWD format for weight map is not implemented yet.")
-                    hint_val = control_feat * weight_map * coin_flip * gate
-
+                scale = scaled_gate if gate else scaled_gate * 0
                 if name not in outs:
-                    outs[name] = hint_val
+                    outs[name] = self._block_step(zero_blocks[name], x, scale)
                 else:
-                    outs[name] += hint_val
+                    self._block_step(zero_blocks[name], x, scale, out=outs[name])
 
         output = base_model.net.forward(
             x=x_input,
@@ -520,15 +748,16 @@ class VideoExtendGeneralDITMulticamEncoder(GeneralDITMulticamEncoder):
                 condition_video_input_mask is not None
             ), "condition_video_input_mask is required for video data type; check if your model_obj is extend_model.FSDPDiffusionModel or the base DiffusionModel"
             if self.cp_group is not None:
-                condition_video_input_mask = rearrange(
-                    condition_video_input_mask, "B C (V T) H W -> B C V T H W", V=self.n_views
-                )
+                B_m, C_m, VT_m, H_m, W_m = condition_video_input_mask.shape
+                condition_video_input_mask = condition_video_input_mask.reshape(
+                    B_m, C_m, self.n_views, VT_m // self.n_views, H_m, W_m
+                )  # [B, C, V, T, H, W]
                 condition_video_input_mask = split_inputs_cp(
                     condition_video_input_mask, seq_dim=3, cp_group=self.cp_group
                 )
-                condition_video_input_mask = rearrange(
-                    condition_video_input_mask, "B C V T H W -> B C (V T) H W", V=self.n_views
-                )
+                condition_video_input_mask = condition_video_input_mask.view(
+                    B_m, C_m, -1, H_m, W_m
+                )  # [B, C, V * T, H, W]
             input_list = [x, condition_video_input_mask]
             if condition_video_pose is not None:
                 if condition_video_pose.shape[2] > T: